@@ -1,20 +1,23 @@
 # backend/app.py - FastAPI backend application
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from typing import List, Optional, Dict, Any, AsyncIterator, Callable
+from datetime import datetime, timezone
 from pathlib import Path
 import json
 import csv
 import io
 import logging
 
+import msgspec
+import orjson
+
 from backend_database import Database
-from backend_models import Table, SyncRequest, SyncResponse, Delta, ChangeOp
+from backend_models import Table, SyncRequest, SyncResponse
 from backend_sync_engine import SyncEngine
 from backend_config import settings
 
@@ -26,7 +29,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="TableHub API",
     description="Offline-first table synchronization backend",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -39,13 +43,23 @@ app.add_middleware(
 )
 
 # Initialize database and sync engine
-db = Database(settings.DATABASE_URL)
-sync_engine = SyncEngine(db)
+db = Database(
+    settings.DATABASE_URL,
+    pool_min_size=settings.DB_POOL_MIN_SIZE,
+    pool_max_size=settings.DB_POOL_MAX_SIZE,
+    table_cache_size=settings.DB_TABLE_CACHE_SIZE
+)
+sync_engine = SyncEngine(
+    db,
+    single_writer=settings.SINGLE_WRITER,
+    table_cache_size=settings.TABLE_CACHE_SIZE
+)
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
     await db.init()
+    await sync_engine.start()
     logger.info("Database initialized")
 
 @app.on_event("shutdown")
@@ -65,40 +79,68 @@ async def health_check():
     }
 
 # Export endpoints
+async def stream_tables_json(trailer: Callable[[int], bytes] = lambda count: b"") -> AsyncIterator[bytes]:
+    """Stream a {"tables": [...]} JSON document one table at a time; trailer(count) adds further keys"""
+    # The opening bracket travels with the first table, so the first chunk
+    # is only produced once the first database read has succeeded
+    head = b'{"tables":['
+    count = 0
+    async for table in db.iter_tables():
+        yield (b"," if count else head) + orjson.dumps(table)
+        count += 1
+    yield (b"" if count else head) + b"]" + trailer(count) + b"}"
+
+async def primed_stream(chunks: AsyncIterator[bytes], action: str) -> AsyncIterator[bytes]:
+    """Fetch the first chunk up front so a failing stream still answers 500; later errors are logged"""
+    try:
+        first = await anext(chunks, b"")
+    except Exception as e:
+        logger.error(f"{action} failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to {action[0].lower()}{action[1:]}")
+    
+    async def generate():
+        yield first
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except Exception as e:
+            # Headers are already sent; the client sees a truncated body
+            logger.error(f"{action} failed: {e}")
+            raise
+    
+    return generate()
+
 @app.get("/api/export.json")
 async def export_json():
-    """Export all tables as JSON"""
-    try:
-        tables = await db.get_all_tables()
-        export_data = {
-            "meta": {
-                "exportedAt": datetime.utcnow().isoformat(),
-                "tableCount": len(tables),
-                "version": "1.0.0"
-            },
-            "tables": tables
+    """Export all tables as JSON, streamed one table at a time"""
+    now = datetime.now(timezone.utc)
+    
+    def meta(table_count: int) -> bytes:
+        # The table count is only known once every table has been sent
+        return b',"meta":' + orjson.dumps({
+            "exportedAt": now.isoformat(),
+            "tableCount": table_count,
+            "version": "1.0.0"
+        })
+    
+    return StreamingResponse(
+        await primed_stream(stream_tables_json(meta), "Export JSON"),
+        media_type="application/json",
+        headers={
+            "Content-Disposition": f"attachment; filename=tablehub-export-{now.strftime('%Y%m%d-%H%M%S')}.json"
         }
-        
-        return JSONResponse(
-            content=export_data,
-            headers={
-                "Content-Disposition": f"attachment; filename=tablehub-export-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
-            }
-        )
-    except Exception as e:
-        logger.error(f"Export JSON failed: {e}")
-        raise HTTPException(status_code=500, detail="Export failed")
+    )
 
 @app.get("/api/export.csv")
 async def export_csv():
-    """Export all tables as CSV"""
-    try:
-        tables = await db.get_all_tables()
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
+    """Export all tables as CSV, streamed one table at a time"""
+    now = datetime.now(timezone.utc)
+    
+    async def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
         
-        for table in tables:
+        async for table in db.iter_tables():
             # Write table name
             writer.writerow([f"Table: {table['name']}"])
             
@@ -111,36 +153,51 @@ async def export_csv():
             
             # Empty row between tables
             writer.writerow([])
-        
-        output.seek(0)
-        
-        return StreamingResponse(
-            io.BytesIO(output.getvalue().encode()),
-            media_type="text/csv",
-            headers={
-                "Content-Disposition": f"attachment; filename=tablehub-export-{datetime.now().strftime('%Y%m%d-%H%M%S')}.csv"
-            }
-        )
-    except Exception as e:
-        logger.error(f"Export CSV failed: {e}")
-        raise HTTPException(status_code=500, detail="Export failed")
+            
+            # Flush this table and reuse the buffer for the next one
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate(0)
+    
+    return StreamingResponse(
+        await primed_stream(generate(), "Export CSV"),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f"attachment; filename=tablehub-export-{now.strftime('%Y%m%d-%H%M%S')}.csv"
+        }
+    )
+
+# Request bodies are decoded and validated by msgspec straight from the raw bytes
+table_decoder = msgspec.json.Decoder(Table)
+sync_request_decoder = msgspec.json.Decoder(SyncRequest)
+json_encoder = msgspec.json.Encoder()
+
+async def decode_body(request: Request, decoder: msgspec.json.Decoder):
+    """Decode a request body, answering 422 when it does not match the model"""
+    try:
+        return decoder.decode(await request.body())
+    except msgspec.ValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid request body: {e}")
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=f"Malformed JSON body: {e}")
+
+def msgspec_response(content: Any) -> Response:
+    """Encode a response body with msgspec"""
+    return Response(content=json_encoder.encode(content), media_type="application/json")
 
 # Table CRUD endpoints
 @app.get("/api/tables")
 async def get_tables():
-    """Get all tables"""
-    try:
-        tables = await db.get_all_tables()
-        return {"tables": tables}
-    except Exception as e:
-        logger.error(f"Get tables failed: {e}")
-        raise HTTPException(status_code=500, detail="Failed to retrieve tables")
+    """Get all tables, streamed one table at a time"""
+    return StreamingResponse(await primed_stream(stream_tables_json(), "Get tables"), media_type="application/json")
 
 @app.post("/api/tables")
-async def create_table(table: Table):
+async def create_table(request: Request):
     """Create a new table"""
+    table = await decode_body(request, table_decoder)
     try:
-        table_id = await db.create_table(table.dict())
+        table_id = await db.create_table(msgspec.to_builtins(table))
+        sync_engine.invalidate_table(table_id)
         return {"id": table_id, "message": "Table created successfully"}
     except Exception as e:
         logger.error(f"Create table failed: {e}")
@@ -161,10 +218,12 @@ async def get_table(table_id: str):
         raise HTTPException(status_code=500, detail="Failed to retrieve table")
 
 @app.put("/api/tables/{table_id}")
-async def update_table(table_id: str, table: Table):
+async def update_table(table_id: str, request: Request):
     """Update a table"""
+    table = await decode_body(request, table_decoder)
     try:
-        success = await db.update_table(table_id, table.dict())
+        success = await db.update_table(table_id, msgspec.to_builtins(table))
+        sync_engine.invalidate_table(table_id)
         if not success:
             raise HTTPException(status_code=404, detail="Table not found")
         return {"message": "Table updated successfully"}
@@ -188,6 +247,7 @@ async def patch_table(table_id: str, updates: Dict[str, Any]):
         
         table["updatedAt"] = datetime.utcnow().isoformat()
         success = await db.update_table(table_id, table)
+        sync_engine.invalidate_table(table_id)
         
         if not success:
             raise HTTPException(status_code=500, detail="Update failed")
@@ -204,6 +264,7 @@ async def delete_table(table_id: str):
     """Delete a table"""
     try:
         success = await db.delete_table(table_id)
+        sync_engine.invalidate_table(table_id)
         if not success:
             raise HTTPException(status_code=404, detail="Table not found")
         return {"message": "Table deleted successfully"}
@@ -215,36 +276,43 @@ async def delete_table(table_id: str):
 
 # Sync endpoints
 @app.post("/api/sync")
-async def sync_push(request: SyncRequest):
+async def sync_push(raw_request: Request):
     """Handle sync push from client"""
+    request = await decode_body(raw_request, sync_request_decoder)
+    
     try:
         # Process operations
         result = await sync_engine.process_sync(
             client_id=request.clientId,
             base_cursor=request.baseCursor,
-            operations=request.ops
+            # SyncEngine and the event log work on plain dicts
+            operations=msgspec.to_builtins(request.ops)
         )
         
-        return SyncResponse(
+        return msgspec_response(SyncResponse(
             success=True,
             cursor=result["cursor"],
             deltas=result.get("deltas", []),
             conflicts=result.get("conflicts", [])
-        )
+        ))
     except Exception as e:
         logger.error(f"Sync push failed: {e}")
-        return SyncResponse(
+        return msgspec_response(SyncResponse(
             success=False,
             error=str(e),
             cursor=request.baseCursor,
             deltas=[],
             conflicts=[]
-        )
+        ))
 
 @app.get("/api/sync")
 async def sync_pull(since: str = Query("0", description="Cursor for incremental sync")):
     """Handle sync pull from client"""
     try:
+        # Fresh clients share one cached, pre-serialized snapshot
+        if since == "0":
+            return Response(content=await sync_engine.get_snapshot(), media_type="application/json")
+        
         # Get changes since cursor
         result = await sync_engine.get_changes_since(since)
         
@@ -274,6 +342,8 @@ if settings.DEBUG:
         """Reset database (debug only)"""
         try:
             await db.reset()
+            sync_engine.invalidate_table()
+            await sync_engine.start()
             return {"message": "Database reset successfully"}
         except Exception as e:
             logger.error(f"Reset failed: {e}")
@@ -284,5 +354,16 @@ frontend_dir = Path(__file__).resolve().parent.parent / "frontend"
 app.mount("/", StaticFiles(directory=frontend_dir, html=True), name="frontend")
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run("backend_app:app", host="0.0.0.0", port=8000, reload=True)
+    
+    # uvloop and httptools ship with uvicorn[standard]; uvloop has no Windows build
+    uvicorn.run(
+        "backend_app:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        reload=settings.RELOAD,
+        workers=settings.WORKERS
+    )
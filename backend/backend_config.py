@@ -1,37 +1,64 @@
 # backend/config.py - Application configuration
 
 import os
+from dataclasses import dataclass, field
 from typing import List
 
+def _env(name: str, default: str):
+    return field(default_factory=lambda: os.getenv(name, default))
+
+def _env_int(name: str, default: str):
+    return field(default_factory=lambda: int(os.getenv(name, default)))
+
+def _env_bool(name: str, default: str):
+    return field(default_factory=lambda: os.getenv(name, default).lower() == "true")
+
+def _env_list(name: str, default: str):
+    return field(default_factory=lambda: os.getenv(name, default).split(","))
+
+@dataclass(frozen=True)
 class Settings:
+    """Settings read from the environment once, when Settings() is built"""
+    
     # Database
-    DATABASE_URL: str = os.getenv(
-        "DATABASE_URL", 
-        "sqlite:///./tablehub.db"
-    )
+    DATABASE_URL: str = _env("DATABASE_URL", "sqlite:///./tablehub.db")
+    # PostgreSQL connection pool bounds
+    DB_POOL_MIN_SIZE: int = _env_int("DB_POOL_MIN_SIZE", "10")
+    DB_POOL_MAX_SIZE: int = _env_int("DB_POOL_MAX_SIZE", "50")
+    # Parsed tables kept by Database.get_table, revalidated by version
+    DB_TABLE_CACHE_SIZE: int = _env_int("DB_TABLE_CACHE_SIZE", "256")
     
     # CORS
-    CORS_ORIGINS: List[str] = os.getenv(
+    CORS_ORIGINS: List[str] = _env_list(
         "CORS_ORIGINS",
         "http://localhost:3000,http://localhost:5173,http://localhost:8080"
-    ).split(",")
+    )
     
     # Debug mode
-    DEBUG: bool = os.getenv("DEBUG", "true").lower() == "true"
+    DEBUG: bool = _env_bool("DEBUG", "true")
     
     # Server
-    HOST: str = os.getenv("HOST", "0.0.0.0")
-    PORT: int = int(os.getenv("PORT", "8000"))
+    HOST: str = _env("HOST", "0.0.0.0")
+    PORT: int = _env_int("PORT", "8000")
+    RELOAD: bool = _env_bool("RELOAD", "false")
+    # Keep at 1 with SQLite: each worker holds its own connection and caches
+    WORKERS: int = _env_int("WORKERS", "1")
     
     # Sync settings
-    MAX_SYNC_BATCH_SIZE: int = int(os.getenv("MAX_SYNC_BATCH_SIZE", "100"))
-    SYNC_EVENT_RETENTION_DAYS: int = int(os.getenv("SYNC_EVENT_RETENTION_DAYS", "30"))
+    MAX_SYNC_BATCH_SIZE: int = _env_int("MAX_SYNC_BATCH_SIZE", "100")
+    SYNC_EVENT_RETENTION_DAYS: int = _env_int("SYNC_EVENT_RETENTION_DAYS", "30")
+    # Set to false when several processes write to the same database, which
+    # disables the sync engine's in-memory table cache and cursor
+    SINGLE_WRITER: bool = _env_bool("SINGLE_WRITER", "true")
+    TABLE_CACHE_SIZE: int = _env_int("TABLE_CACHE_SIZE", "128")
     
     # Security (for production)
-    SECRET_KEY: str = os.getenv("SECRET_KEY", "change-me-in-production")
-    JWT_ENABLED: bool = os.getenv("JWT_ENABLED", "false").lower() == "true"
-    JWT_SECRET: str = os.getenv("JWT_SECRET", SECRET_KEY)
+    SECRET_KEY: str = _env("SECRET_KEY", "change-me-in-production")
+    JWT_ENABLED: bool = _env_bool("JWT_ENABLED", "false")
+    JWT_SECRET: str = field(
+        default_factory=lambda: os.getenv("JWT_SECRET", os.getenv("SECRET_KEY", "change-me-in-production"))
+    )
     JWT_ALGORITHM: str = "HS256"
-    JWT_EXPIRATION_HOURS: int = int(os.getenv("JWT_EXPIRATION_HOURS", "24"))
+    JWT_EXPIRATION_HOURS: int = _env_int("JWT_EXPIRATION_HOURS", "24")
 
 settings = Settings()
@@ -1,20 +1,193 @@
 # backend/database.py - Database operations
 
-import json
+import asyncio
 import aiosqlite
 import asyncpg
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import orjson
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Awaitable, Callable
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Delta fields projected from sync_events, in select order
+_DELTA_FIELDS = (
+    "op", "tableId", "rowId", "col", "value", "afterRowId",
+    "colIndex", "header", "name", "serverTs", "by"
+)
+
+_SQLITE_DELTA_COLUMNS = (
+    "json_extract(operation, '$.op'), json_extract(operation, '$.tableId'), "
+    "json_extract(operation, '$.rowId'), json_extract(operation, '$.col'), "
+    "json_extract(operation, '$.value'), json_extract(operation, '$.afterRowId'), "
+    "json_extract(operation, '$.colIndex'), json_extract(operation, '$.header'), "
+    "json_extract(operation, '$.name'), server_ts, client_id"
+)
+
+_PG_DELTA_COLUMNS = (
+    "operation->>'op', operation->>'tableId', "
+    "operation->>'rowId', (operation->>'col')::int, "
+    "operation->>'value', operation->>'afterRowId', "
+    "(operation->>'colIndex')::int, operation->>'header', "
+    "operation->>'name', to_json(server_ts)#>>'{}', client_id"
+)
+
+# Explicit column lists so rows are read positionally; PostgreSQL renders
+# timestamps to ISO strings itself instead of a per-row isoformat() call
+_TABLE_COLUMNS_SQLITE = "id, name, data, updated_at, version"
+_TABLE_COLUMNS_PG = "id, name, data, to_json(updated_at)#>>'{}', version"
+
+_EVENT_COLUMNS_SQLITE = "id, cursor, client_id, operation, server_ts, applied"
+_EVENT_COLUMNS_PG = "id, cursor, client_id, operation, to_json(server_ts)#>>'{}', applied"
+
+# Queries are built once at import so every call passes the identical string
+# to asyncpg's statement cache and sqlite3's statement cache
+_SELECT_TABLES_PG = f"SELECT {_TABLE_COLUMNS_PG} FROM tables ORDER BY updated_at DESC"
+_SELECT_TABLES_SQLITE = f"SELECT {_TABLE_COLUMNS_SQLITE} FROM tables ORDER BY updated_at DESC"
+_SELECT_TABLE_PG = f"SELECT {_TABLE_COLUMNS_PG} FROM tables WHERE id = $1"
+_SELECT_TABLE_SQLITE = f"SELECT {_TABLE_COLUMNS_SQLITE} FROM tables WHERE id = ?"
+_INSERT_TABLE_PG = "INSERT INTO tables (id, name, data) VALUES ($1, $2, $3)"
+_INSERT_TABLE_SQLITE = "INSERT INTO tables (id, name, data) VALUES (?, ?, ?)"
+_UPDATE_TABLE_PG = (
+    "UPDATE tables SET name = $2, data = $3, updated_at = CURRENT_TIMESTAMP, version = version + 1 "
+    "WHERE id = $1"
+)
+_UPDATE_TABLE_SQLITE = (
+    "UPDATE tables SET name = ?, data = ?, updated_at = CURRENT_TIMESTAMP, version = version + 1 "
+    "WHERE id = ?"
+)
+_DELETE_TABLE_PG = "DELETE FROM tables WHERE id = $1"
+_DELETE_TABLE_SQLITE = "DELETE FROM tables WHERE id = ?"
+# Sync writes only land on the version they were applied to; a changed
+# version means another writer stored the table in between
+_UPDATE_TABLE_IF_VERSION_PG = (
+    "UPDATE tables SET name = $2, data = $3, updated_at = CURRENT_TIMESTAMP, version = version + 1 "
+    "WHERE id = $1 AND version = $4"
+)
+_UPDATE_TABLE_IF_VERSION_SQLITE = (
+    "UPDATE tables SET name = ?, data = ?, updated_at = CURRENT_TIMESTAMP, version = version + 1 "
+    "WHERE id = ? AND version = ?"
+)
+_DELETE_TABLE_IF_VERSION_PG = "DELETE FROM tables WHERE id = $1 AND version = $2"
+_DELETE_TABLE_IF_VERSION_SQLITE = "DELETE FROM tables WHERE id = ? AND version = ?"
+_SELECT_TABLE_VERSION_PG = "SELECT version FROM tables WHERE id = $1"
+_SELECT_TABLE_VERSION_SQLITE = "SELECT version FROM tables WHERE id = ?"
+
+# Event sequence numbers come from the database, taken while holding a lock
+# that is only released at commit, so events become visible in seq order
+# no matter how many processes write
+_LOCK_EVENTS_PG = "SELECT pg_advisory_xact_lock(hashtext('sync_events'))"
+# One INSERT over the unnested operations; seq and cursor follow the id
+_INSERT_EVENTS_PG = (
+    "WITH inserted AS ("
+    "INSERT INTO sync_events (id, seq, cursor, client_id, operation) "
+    "SELECT e.id, e.id, e.id || '_' || $1::text, $1::text, e.operation "
+    "FROM (SELECT nextval('sync_events_id_seq') AS id, o.operation "
+    "FROM unnest($2::jsonb[]) WITH ORDINALITY AS o(operation, ord) ORDER BY o.ord) e "
+    "RETURNING seq, cursor"
+    ") SELECT cursor FROM inserted ORDER BY seq DESC LIMIT 1"
+)
+# Move the id sequence past seqs stored before events took their seq from it
+_SYNC_EVENT_ID_SEQ_PG = (
+    "SELECT setval('sync_events_id_seq', GREATEST(m, (SELECT last_value FROM sync_events_id_seq))) "
+    "FROM (SELECT MAX(seq) AS m FROM sync_events) s WHERE m IS NOT NULL"
+)
+# SQLite runs every write job under BEGIN IMMEDIATE, so reading the last
+# seq and inserting after it cannot interleave with another writer
+_LAST_EVENT_SEQ_SQLITE = (
+    "SELECT MAX(COALESCE((SELECT MAX(seq) FROM sync_events), 0), "
+    "COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'sync_events'), 0))"
+)
+_INSERT_EVENT_SQLITE = "INSERT INTO sync_events (id, seq, cursor, client_id, operation) VALUES (?, ?, ?, ?, ?)"
+_SELECT_EVENTS_SINCE_PG = f"SELECT {_EVENT_COLUMNS_PG} FROM sync_events WHERE seq > $1 ORDER BY seq ASC LIMIT $2"
+_SELECT_EVENTS_SINCE_SQLITE = f"SELECT {_EVENT_COLUMNS_SQLITE} FROM sync_events WHERE seq > ? ORDER BY seq ASC LIMIT ?"
+_SELECT_RECENT_EVENTS_PG = f"SELECT {_EVENT_COLUMNS_PG} FROM sync_events ORDER BY id DESC LIMIT $1"
+_SELECT_RECENT_EVENTS_SQLITE = f"SELECT {_EVENT_COLUMNS_SQLITE} FROM sync_events ORDER BY id DESC LIMIT ?"
+_SELECT_DELTAS_SINCE_PG = f"SELECT {_PG_DELTA_COLUMNS} FROM sync_events WHERE seq > $1 ORDER BY seq ASC LIMIT $2"
+_SELECT_DELTAS_SINCE_SQLITE = f"SELECT {_SQLITE_DELTA_COLUMNS} FROM sync_events WHERE seq > ? ORDER BY seq ASC LIMIT ?"
+_SELECT_OTHER_DELTAS_SINCE_PG = (
+    f"SELECT {_PG_DELTA_COLUMNS} FROM sync_events WHERE seq > $1 AND client_id != $2 ORDER BY seq ASC LIMIT $3"
+)
+_SELECT_OTHER_DELTAS_SINCE_SQLITE = (
+    f"SELECT {_SQLITE_DELTA_COLUMNS} FROM sync_events WHERE seq > ? AND client_id != ? ORDER BY seq ASC LIMIT ?"
+)
+_SELECT_LATEST_CURSOR = "SELECT cursor FROM sync_events ORDER BY seq DESC LIMIT 1"
+# Fresh-client bootstrap as one statement: latest cursor, the first page of
+# deltas as [field, ...] arrays and every table, all read from one snapshot
+_SELECT_BOOTSTRAP_PG = (
+    "SELECT (SELECT cursor FROM sync_events ORDER BY seq DESC LIMIT 1), "
+    f"(SELECT COALESCE(jsonb_agg(jsonb_build_array({_PG_DELTA_COLUMNS}) ORDER BY seq), '[]') "
+    "FROM (SELECT * FROM sync_events ORDER BY seq ASC LIMIT $1) e), "
+    "(SELECT COALESCE(jsonb_agg(data || jsonb_build_object("
+    "'id', id, 'name', name, 'updatedAt', to_json(updated_at)#>>'{}', 'version', version"
+    ") ORDER BY updated_at DESC), '[]') FROM tables)"
+)
+_SELECT_BOOTSTRAP_SQLITE = (
+    "SELECT (SELECT cursor FROM sync_events ORDER BY seq DESC LIMIT 1), "
+    f"(SELECT json_group_array(json_array({_SQLITE_DELTA_COLUMNS})) "
+    "FROM (SELECT * FROM sync_events ORDER BY seq ASC LIMIT ?)), "
+    "(SELECT json_group_array(json_set(data, '$.id', id, '$.name', name, '$.updatedAt', updated_at, '$.version', version)) "
+    "FROM (SELECT * FROM tables ORDER BY updated_at DESC))"
+)
+_LEGACY_CURSOR_SEQ_PG = (
+    "SELECT COALESCE((SELECT seq FROM sync_events WHERE cursor = $1), (SELECT MAX(seq) FROM sync_events), 0)"
+)
+_LEGACY_CURSOR_SEQ_SQLITE = (
+    "SELECT COALESCE((SELECT seq FROM sync_events WHERE cursor = ?), (SELECT MAX(seq) FROM sync_events), 0)"
+)
+
+def _dumps(obj: Any) -> str:
+    """Serialize to a JSON string for SQLite JSON/TEXT columns"""
+    return orjson.dumps(obj).decode()
+
+# jsonb's binary wire format is a version byte followed by the JSON text, so
+# orjson can work on the raw buffer without a UTF-8 str in between
+_JSONB_VERSION = b"\x01"
+
+def _encode_jsonb(obj: Any) -> bytes:
+    """Encode a value for the binary jsonb codec"""
+    return _JSONB_VERSION + orjson.dumps(obj)
+
+def _decode_jsonb(data: bytes) -> Any:
+    """Decode a value from the binary jsonb codec"""
+    return orjson.loads(memoryview(data)[1:])
+
+# Table keys kept out of the stored data blob: id and name have their own
+# columns, and _rowIndex is the sync engine's in-memory row lookup
+_NON_PAYLOAD_KEYS = ("id", "name", "_rowIndex")
+
+# Most SQLite write jobs the writer task commits in one transaction
+_WRITE_BATCH_SIZE = 256
+
+# Sequence numbers are bound as signed 64-bit integers by both drivers
+_MAX_SEQ = 2**63 - 1
+
+def cursor_seq(cursor: str) -> Optional[int]:
+    """Extract the sequence number from a "{seq}_{client_id}" cursor, or None if it has none"""
+    try:
+        seq = int(cursor.split("_", 1)[0])
+    except ValueError:
+        return None
+    # Out-of-range values cannot be real seqs; treat them like any unknown cursor
+    return seq if -_MAX_SEQ - 1 <= seq <= _MAX_SEQ else None
+
 class Database:
-    def __init__(self, database_url: str):
+    def __init__(self, database_url: str, pool_min_size: int = 10, pool_max_size: int = 50,
+                 table_cache_size: int = 256):
         self.database_url = database_url
+        self.pool_min_size = pool_min_size
+        self.pool_max_size = pool_max_size
+        # LRU of table_id -> (version, serialized table) for get_table; entries
+        # are checked against the stored version, so other writers are seen too
+        self.table_cache_size = table_cache_size
+        self._table_cache: "OrderedDict[str, Tuple[int, bytes]]" = OrderedDict()
         self.is_postgres = database_url.startswith("postgresql://")
+        self.sqlite_path = database_url.replace("sqlite:///", "")
         self.conn = None
+        self.read_conn = None
         self.pool = None
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
     
     async def init(self):
         """Initialize database connection and create tables"""
@@ -25,7 +198,16 @@ class Database:
     
     async def _init_sqlite(self):
         """Initialize SQLite database"""
-        self.conn = await aiosqlite.connect(self.database_url.replace("sqlite:///", ""))
+        path = self.sqlite_path
+        self.conn = await aiosqlite.connect(path)
+        
+        # WAL lets readers run alongside the writer and, with synchronous=NORMAL,
+        # fsyncs at checkpoints instead of on every commit
+        await self.conn.execute("PRAGMA journal_mode=WAL")
+        await self.conn.execute("PRAGMA synchronous=NORMAL")
+        await self.conn.execute("PRAGMA temp_store=MEMORY")
+        await self.conn.execute("PRAGMA mmap_size=268435456")
+        await self.conn.execute("PRAGMA cache_size=-64000")
         
         # Create tables
         await self.conn.execute("""
@@ -45,13 +227,31 @@ class Database:
                 client_id TEXT NOT NULL,
                 operation TEXT NOT NULL,
                 server_ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                applied BOOLEAN DEFAULT TRUE
+                applied BOOLEAN DEFAULT TRUE,
+                seq INTEGER
             )
         """)
         
+        # Databases created before seq existed: add it, ordering old events by id
+        async with self.conn.execute("PRAGMA table_info(sync_events)") as cursor:
+            columns = [row[1] for row in await cursor.fetchall()]
+        if "seq" not in columns:
+            await self.conn.execute("ALTER TABLE sync_events ADD COLUMN seq INTEGER")
+            await self.conn.execute("UPDATE sync_events SET seq = id")
+        
+        # Cursor lookups are covered by the UNIQUE constraint's index; the
+        # extra index on the same column only slowed down inserts
+        await self.conn.execute("DROP INDEX IF EXISTS idx_sync_events_cursor")
+        
+        await self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sync_events_seq 
+            ON sync_events(seq)
+        """)
+        
+        # Lets get_table's version probe read the index alone
         await self.conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_sync_events_cursor 
-            ON sync_events(cursor)
+            CREATE INDEX IF NOT EXISTS idx_tables_version 
+            ON tables(id, version)
         """)
         
         await self.conn.execute("""
@@ -59,11 +259,52 @@ class Database:
             ON sync_events(server_ts)
         """)
         
+        # Table listings are ordered newest first
+        await self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tables_updated 
+            ON tables(updated_at DESC)
+        """)
+        
         await self.conn.commit()
+        
+        # Let the query planner gather statistics for the indexes above
+        await self.conn.execute("PRAGMA optimize")
+        
+        # Reads get their own read-only connection so they never queue behind
+        # writes; an in-memory database is private to its connection
+        if path == ":memory:":
+            self.read_conn = self.conn
+        else:
+            self.read_conn = await self._connect_sqlite_reader()
+        
+        # All writes go through a single background task that owns self.conn
+        self._write_queue = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._writer_loop())
+    
+    async def _connect_sqlite_reader(self) -> aiosqlite.Connection:
+        """Open a read-only connection to the SQLite database"""
+        conn = await aiosqlite.connect(f"file:{self.sqlite_path}?mode=ro", uri=True)
+        await conn.execute("PRAGMA temp_store=MEMORY")
+        await conn.execute("PRAGMA mmap_size=268435456")
+        await conn.execute("PRAGMA cache_size=-64000")
+        return conn
     
     async def _init_postgres(self):
         """Initialize PostgreSQL database"""
-        self.pool = await asyncpg.create_pool(self.database_url)
+        # asyncpg prepares each query on first use and keeps it in a per-connection
+        # statement cache keyed by the SQL text, so hot queries are parsed once
+        self.pool = await asyncpg.create_pool(
+            self.database_url,
+            min_size=self.pool_min_size,
+            max_size=self.pool_max_size,
+            max_inactive_connection_lifetime=300,
+            command_timeout=30,
+            statement_cache_size=1024,
+            # Timestamps come from CURRENT_TIMESTAMP in SQL; pin the session
+            # zone so TIMESTAMP columns keep holding UTC
+            server_settings={"timezone": "UTC"},
+            init=self._init_pg_connection
+        )
         
         async with self.pool.acquire() as conn:
             # Create tables
@@ -84,47 +325,232 @@ class Database:
                     client_id TEXT NOT NULL,
                     operation JSONB NOT NULL,
                     server_ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    applied BOOLEAN DEFAULT TRUE
+                    applied BOOLEAN DEFAULT TRUE,
+                    seq BIGINT
                 )
             """)
             
+            # Databases created before seq existed: add it, ordering old events by id
+            await conn.execute("ALTER TABLE sync_events ADD COLUMN IF NOT EXISTS seq BIGINT")
+            await conn.execute("UPDATE sync_events SET seq = id WHERE seq IS NULL")
+            async with conn.transaction():
+                await conn.execute(_LOCK_EVENTS_PG)
+                await conn.execute(_SYNC_EVENT_ID_SEQ_PG)
+            
+            # Cursor lookups are covered by the UNIQUE constraint's index; the
+            # extra index on the same column only slowed down inserts
+            await conn.execute("DROP INDEX IF EXISTS idx_sync_events_cursor")
+            
+            # Event reads walk seq; carrying the small columns in the index lets
+            # cursor and client filters run from the index. The operation stays
+            # out: large payloads would exceed the btree row size limit. The
+            # index also serves plain seq lookups, so the narrower one is dropped
+            await conn.execute("DROP INDEX IF EXISTS idx_sync_events_cover")
             await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_sync_events_cursor 
-                ON sync_events(cursor)
+                CREATE INDEX IF NOT EXISTS idx_sync_events_seq_cover 
+                ON sync_events(seq) INCLUDE (cursor, client_id, server_ts, applied)
             """)
+            await conn.execute("DROP INDEX IF EXISTS idx_sync_events_seq")
             
             await conn.execute("""
                 CREATE INDEX IF NOT EXISTS idx_sync_events_ts 
                 ON sync_events(server_ts)
             """)
+            
+            # Table listings are ordered newest first
+            await conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_tables_updated 
+                ON tables(updated_at DESC, id)
+            """)
+            
+            # Refresh planner statistics so the new indexes are picked up
+            await conn.execute("ANALYZE tables")
+            await conn.execute("ANALYZE sync_events")
+    
+    async def _init_pg_connection(self, conn):
+        """Set up a new pool connection so jsonb values are encoded and decoded with orjson"""
+        await conn.set_type_codec(
+            "jsonb",
+            encoder=_encode_jsonb,
+            decoder=_decode_jsonb,
+            schema="pg_catalog",
+            format="binary"
+        )
     
     async def close(self):
         """Close database connection"""
         if self.is_postgres and self.pool:
             await self.pool.close()
         elif self.conn:
+            if self._writer_task:
+                # Let queued writes finish before closing
+                await self._write_queue.put(None)
+                await self._writer_task
+            if self.read_conn is not self.conn:
+                await self.read_conn.close()
             await self.conn.close()
     
+    # SQLite writer
+    async def _writer_loop(self):
+        """Run queued SQLite write jobs, committing each burst of them as one transaction"""
+        while True:
+            batch = [await self._write_queue.get()]
+            # Take whatever else is already waiting so one commit covers it all;
+            # a lone write is committed right away rather than held back
+            while len(batch) < _WRITE_BATCH_SIZE and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+            
+            jobs = [item for item in batch if item is not None]
+            try:
+                if len(jobs) == 1:
+                    await self._run_write_job(*jobs[0])
+                elif jobs:
+                    await self._run_write_batch(jobs)
+            except Exception as e:
+                # The writer must outlive any one batch, or every later _write() hangs
+                logger.error(f"SQLite write batch failed: {e}")
+                for job, future in jobs:
+                    if not future.done():
+                        future.set_exception(e)
+            
+            if len(jobs) < len(batch):
+                # close() was called; everything queued before it is done
+                return
+    
+    async def _run_write_job(self, job: Callable[[aiosqlite.Connection], Awaitable[Any]],
+                             future: asyncio.Future):
+        """Run a single write job in its own transaction"""
+        try:
+            await self.conn.execute("BEGIN IMMEDIATE")
+            result = await job(self.conn)
+            await self.conn.commit()
+        except Exception as e:
+            await self._rollback()
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+    
+    async def _run_write_batch(self, jobs: List[Tuple[Callable[[aiosqlite.Connection], Awaitable[Any]], asyncio.Future]]):
+        """Run write jobs in one transaction, each under a savepoint so a failing job only undoes itself"""
+        done = []
+        try:
+            await self.conn.execute("BEGIN IMMEDIATE")
+            for job, future in jobs:
+                await self.conn.execute("SAVEPOINT write_job")
+                try:
+                    result = await job(self.conn)
+                except Exception as e:
+                    await self.conn.execute("ROLLBACK TO write_job")
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    done.append((future, result))
+                await self.conn.execute("RELEASE write_job")
+            await self.conn.commit()
+        except Exception as e:
+            # The transaction itself failed; none of the batch was stored
+            await self._rollback()
+            for job, future in jobs:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        # Results are only handed out once the commit has succeeded
+        for future, result in done:
+            if not future.done():
+                future.set_result(result)
+    
+    async def _rollback(self):
+        """Roll back the writer's transaction, logging rather than raising on failure"""
+        try:
+            await self.conn.rollback()
+        except Exception as e:
+            logger.error(f"SQLite rollback failed: {e}")
+    
+    async def _write(self, job: Callable[[aiosqlite.Connection], Awaitable[Any]]) -> Any:
+        """Queue a write job for the SQLite writer task and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((job, future))
+        return await future
+    
     # Table operations
     async def get_all_tables(self) -> List[Dict[str, Any]]:
         """Get all tables"""
         if self.is_postgres:
             async with self.pool.acquire() as conn:
-                rows = await conn.fetch("SELECT * FROM tables ORDER BY updated_at DESC")
+                rows = await conn.fetch(_SELECT_TABLES_PG)
                 return [self._parse_table_row(row) for row in rows]
         else:
-            async with self.conn.execute("SELECT * FROM tables ORDER BY updated_at DESC") as cursor:
+            async with self.read_conn.execute(_SELECT_TABLES_SQLITE) as cursor:
                 rows = await cursor.fetchall()
                 return [self._parse_table_row_sqlite(row) for row in rows]
     
+    async def iter_tables(self, chunk: int = 50) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate over all tables, fetching and parsing `chunk` rows at a time"""
+        if self.is_postgres:
+            async with self.pool.acquire() as conn:
+                # Server-side cursors require a transaction
+                async with conn.transaction():
+                    async for row in conn.cursor(_SELECT_TABLES_PG, prefetch=chunk):
+                        yield self._parse_table_row(row)
+        elif self.sqlite_path == ":memory:":
+            # The only connection is the writer's; never hold a statement on it across a yield
+            async with self.read_conn.execute(_SELECT_TABLES_SQLITE) as cursor:
+                rows = await cursor.fetchall()
+            for row in rows:
+                yield self._parse_table_row_sqlite(row)
+        else:
+            # An open statement pins its connection's read snapshot until it
+            # finishes, so a stream reads on its own connection and the shared
+            # read_conn keeps seeing new commits while the download runs
+            conn = await self._connect_sqlite_reader()
+            try:
+                async with conn.execute(_SELECT_TABLES_SQLITE) as cursor:
+                    cursor.iter_chunk_size = chunk
+                    async for row in cursor:
+                        yield self._parse_table_row_sqlite(row)
+            finally:
+                await conn.close()
+    
     async def get_table(self, table_id: str) -> Optional[Dict[str, Any]]:
-        """Get a specific table"""
+        """Get a specific table, served from the cache while its version is unchanged"""
+        cached = self._table_cache.get(table_id)
+        if cached is not None:
+            if await self._get_table_version(table_id) == cached[0]:
+                # A write may have dropped the entry during the version probe
+                if self._table_cache.get(table_id) is cached:
+                    self._table_cache.move_to_end(table_id)
+                # Callers mutate tables in place, so each one gets a fresh copy
+                return orjson.loads(cached[1])
+            self._table_cache.pop(table_id, None)
+        
+        table = await self._fetch_table(table_id)
+        if table is not None and self.table_cache_size > 0:
+            self._table_cache[table_id] = (table["version"], orjson.dumps(table))
+            if len(self._table_cache) > self.table_cache_size:
+                self._table_cache.popitem(last=False)
+        return table
+    
+    async def _get_table_version(self, table_id: str) -> Optional[int]:
+        """Get a table's version without reading its data"""
         if self.is_postgres:
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow("SELECT * FROM tables WHERE id = $1", table_id)
+                return await conn.fetchval(_SELECT_TABLE_VERSION_PG, table_id)
+        else:
+            async with self.read_conn.execute(_SELECT_TABLE_VERSION_SQLITE, (table_id,)) as cursor:
+                row = await cursor.fetchone()
+                return row[0] if row else None
+    
+    async def _fetch_table(self, table_id: str) -> Optional[Dict[str, Any]]:
+        """Read and parse a table row"""
+        if self.is_postgres:
+            async with self.pool.acquire() as conn:
+                row = await conn.fetchrow(_SELECT_TABLE_PG, table_id)
                 return self._parse_table_row(row) if row else None
         else:
-            async with self.conn.execute("SELECT * FROM tables WHERE id = ?", (table_id,)) as cursor:
+            async with self.read_conn.execute(_SELECT_TABLE_SQLITE, (table_id,)) as cursor:
                 row = await cursor.fetchone()
                 return self._parse_table_row_sqlite(row) if row else None
     
@@ -134,130 +560,164 @@ class Database:
         name = table_data["name"]
         
         # Remove id and name from data to store in JSONB
-        data = {k: v for k, v in table_data.items() if k not in ["id", "name"]}
+        data = self._table_payload(table_data)
+        # A recreated table starts over at version 1, so drop any stale entry
+        self._table_cache.pop(table_id, None)
         
         if self.is_postgres:
             async with self.pool.acquire() as conn:
-                await conn.execute(
-                    """INSERT INTO tables (id, name, data, updated_at) 
-                       VALUES ($1, $2, $3, $4)""",
-                    table_id, name, json.dumps(data), datetime.utcnow()
-                )
+                await conn.execute(_INSERT_TABLE_PG, table_id, name, data)
         else:
-            await self.conn.execute(
-                """INSERT INTO tables (id, name, data, updated_at) 
-                   VALUES (?, ?, ?, ?)""",
-                (table_id, name, json.dumps(data), datetime.utcnow())
-            )
-            await self.conn.commit()
+            params = (table_id, name, _dumps(data))
+            
+            async def write(conn):
+                await conn.execute(_INSERT_TABLE_SQLITE, params)
+            
+            await self._write(write)
         
         return table_id
     
     async def update_table(self, table_id: str, table_data: Dict[str, Any]) -> bool:
         """Update a table"""
         name = table_data.get("name", "")
-        data = {k: v for k, v in table_data.items() if k not in ["id", "name"]}
+        data = self._table_payload(table_data)
+        self._table_cache.pop(table_id, None)
         
         if self.is_postgres:
             async with self.pool.acquire() as conn:
-                result = await conn.execute(
-                    """UPDATE tables 
-                       SET name = $2, data = $3, updated_at = $4, version = version + 1
-                       WHERE id = $1""",
-                    table_id, name, json.dumps(data), datetime.utcnow()
-                )
+                result = await conn.execute(_UPDATE_TABLE_PG, table_id, name, data)
                 return result != "UPDATE 0"
         else:
-            cursor = await self.conn.execute(
-                """UPDATE tables 
-                   SET name = ?, data = ?, updated_at = ?, version = version + 1
-                   WHERE id = ?""",
-                (name, json.dumps(data), datetime.utcnow(), table_id)
-            )
-            await self.conn.commit()
-            return cursor.rowcount > 0
+            params = (name, _dumps(data), table_id)
+            
+            async def write(conn):
+                cursor = await conn.execute(_UPDATE_TABLE_SQLITE, params)
+                return cursor.rowcount > 0
+            
+            return await self._write(write)
     
     async def delete_table(self, table_id: str) -> bool:
         """Delete a table"""
+        self._table_cache.pop(table_id, None)
+        
         if self.is_postgres:
             async with self.pool.acquire() as conn:
-                result = await conn.execute("DELETE FROM tables WHERE id = $1", table_id)
+                result = await conn.execute(_DELETE_TABLE_PG, table_id)
                 return result != "DELETE 0"
         else:
-            cursor = await self.conn.execute("DELETE FROM tables WHERE id = ?", (table_id,))
-            await self.conn.commit()
-            return cursor.rowcount > 0
+            async def write(conn):
+                cursor = await conn.execute(_DELETE_TABLE_SQLITE, (table_id,))
+                return cursor.rowcount > 0
+            
+            return await self._write(write)
     
     # Sync operations
-    async def add_sync_event(self, cursor: str, client_id: str, operation: Dict[str, Any]) -> int:
-        """Add a sync event"""
+    async def add_sync_event(self, client_id: str, operation: Dict[str, Any]) -> str:
+        """Add a sync event and return its cursor"""
+        return await self.add_sync_events(client_id, [operation])
+    
+    async def add_sync_events(self, client_id: str, operations: List[Dict[str, Any]]) -> str:
+        """Add a batch of sync events from one client in one transaction and return the newest cursor"""
         if self.is_postgres:
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    """INSERT INTO sync_events (cursor, client_id, operation, server_ts)
-                       VALUES ($1, $2, $3, $4)
-                       RETURNING id""",
-                    cursor, client_id, json.dumps(operation), datetime.utcnow()
-                )
-                return row["id"]
+                async with conn.transaction():
+                    return await self._insert_events_pg(conn, client_id, operations)
         else:
-            cursor_result = await self.conn.execute(
-                """INSERT INTO sync_events (cursor, client_id, operation, server_ts)
-                   VALUES (?, ?, ?, ?)""",
-                (cursor, client_id, json.dumps(operation), datetime.utcnow())
-            )
-            await self.conn.commit()
-            return cursor_result.lastrowid
+            return await self._write(lambda conn: self._insert_events_sqlite(conn, client_id, operations))
+    
+    async def save_table_changes(self, table_id: str, version: int, table_data: Optional[Dict[str, Any]],
+                                 client_id: str, operations: List[Dict[str, Any]]) -> Optional[str]:
+        """Store a table's new state (None deletes it) with its events in one transaction; None if it is no longer at `version`"""
+        self._table_cache.pop(table_id, None)
+        
+        if self.is_postgres:
+            async with self.pool.acquire() as conn:
+                async with conn.transaction():
+                    if table_data is None:
+                        result = await conn.execute(_DELETE_TABLE_IF_VERSION_PG, table_id, version)
+                    else:
+                        result = await conn.execute(
+                            _UPDATE_TABLE_IF_VERSION_PG, table_id, table_data.get("name", ""),
+                            self._table_payload(table_data), version
+                        )
+                    if result.endswith(" 0"):
+                        return None
+                    return await self._insert_events_pg(conn, client_id, operations)
+        else:
+            if table_data is None:
+                query, params = _DELETE_TABLE_IF_VERSION_SQLITE, (table_id, version)
+            else:
+                params = (table_data.get("name", ""), _dumps(self._table_payload(table_data)), table_id, version)
+                query = _UPDATE_TABLE_IF_VERSION_SQLITE
+            
+            async def write(conn):
+                cursor = await conn.execute(query, params)
+                if cursor.rowcount == 0:
+                    return None
+                return await self._insert_events_sqlite(conn, client_id, operations)
+            
+            return await self._write(write)
+    
+    async def _insert_events_pg(self, conn, client_id: str, operations: List[Dict[str, Any]]) -> str:
+        """Insert events inside the caller's transaction; the jsonb codec serializes each operation"""
+        await conn.execute(_LOCK_EVENTS_PG)
+        return await conn.fetchval(_INSERT_EVENTS_PG, client_id, operations)
+    
+    async def _insert_events_sqlite(self, conn: aiosqlite.Connection, client_id: str,
+                                    operations: List[Dict[str, Any]]) -> str:
+        """Insert events inside a write job, numbering them after the last stored seq"""
+        async with conn.execute(_LAST_EVENT_SEQ_SQLITE) as cursor:
+            (last_seq,) = await cursor.fetchone()
+        
+        params = [
+            (seq, seq, f"{seq}_{client_id}", client_id, _dumps(operation))
+            for seq, operation in enumerate(operations, last_seq + 1)
+        ]
+        await conn.executemany(_INSERT_EVENT_SQLITE, params)
+        return params[-1][2]
     
     async def get_events_since(self, cursor: str, limit: int = 100) -> List[Dict[str, Any]]:
         """Get sync events since a cursor"""
+        since = await self._resolve_cursor_seq(cursor)
+        
         if self.is_postgres:
             async with self.pool.acquire() as conn:
-                if cursor == "0":
-                    rows = await conn.fetch(
-                        """SELECT * FROM sync_events 
-                           ORDER BY id ASC LIMIT $1""",
-                        limit
-                    )
-                else:
-                    rows = await conn.fetch(
-                        """SELECT * FROM sync_events 
-                           WHERE id > (SELECT id FROM sync_events WHERE cursor = $1)
-                           ORDER BY id ASC LIMIT $2""",
-                        cursor, limit
-                    )
+                rows = await conn.fetch(_SELECT_EVENTS_SINCE_PG, since, limit)
                 return [self._parse_event_row(row) for row in rows]
         else:
-            if cursor == "0":
-                query = """SELECT * FROM sync_events 
-                          ORDER BY id ASC LIMIT ?"""
-                params = (limit,)
-            else:
-                query = """SELECT * FROM sync_events 
-                          WHERE id > (SELECT id FROM sync_events WHERE cursor = ?)
-                          ORDER BY id ASC LIMIT ?"""
-                params = (cursor, limit)
-            
-            async with self.conn.execute(query, params) as cursor_result:
+            async with self.read_conn.execute(_SELECT_EVENTS_SINCE_SQLITE, (since, limit)) as cursor_result:
                 rows = await cursor_result.fetchall()
                 return [self._parse_event_row_sqlite(row) for row in rows]
     
+    async def get_deltas_since(self, cursor: str, exclude_client_id: Optional[str] = None,
+                               limit: int = 100) -> List[Dict[str, Any]]:
+        """Get client deltas since a cursor, projected straight from the stored operations"""
+        since = await self._resolve_cursor_seq(cursor)
+        
+        if exclude_client_id is None:
+            params = (since, limit)
+            query = _SELECT_DELTAS_SINCE_PG if self.is_postgres else _SELECT_DELTAS_SINCE_SQLITE
+        else:
+            params = (since, exclude_client_id, limit)
+            query = _SELECT_OTHER_DELTAS_SINCE_PG if self.is_postgres else _SELECT_OTHER_DELTAS_SINCE_SQLITE
+        
+        if self.is_postgres:
+            async with self.pool.acquire() as conn:
+                rows = await conn.fetch(query, *params)
+        else:
+            async with self.read_conn.execute(query, params) as cursor_result:
+                rows = await cursor_result.fetchall()
+        
+        return [dict(zip(_DELTA_FIELDS, row)) for row in rows]
+    
     async def get_recent_events(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Get recent sync events"""
         if self.is_postgres:
             async with self.pool.acquire() as conn:
-                rows = await conn.fetch(
-                    """SELECT * FROM sync_events 
-                       ORDER BY id DESC LIMIT $1""",
-                    limit
-                )
+                rows = await conn.fetch(_SELECT_RECENT_EVENTS_PG, limit)
                 return [self._parse_event_row(row) for row in rows]
         else:
-            async with self.conn.execute(
-                """SELECT * FROM sync_events 
-                   ORDER BY id DESC LIMIT ?""",
-                (limit,)
-            ) as cursor:
+            async with self.read_conn.execute(_SELECT_RECENT_EVENTS_SQLITE, (limit,)) as cursor:
                 rows = await cursor.fetchall()
                 return [self._parse_event_row_sqlite(row) for row in rows]
     
@@ -265,61 +725,94 @@ class Database:
         """Get the latest sync cursor"""
         if self.is_postgres:
             async with self.pool.acquire() as conn:
-                row = await conn.fetchrow(
-                    "SELECT cursor FROM sync_events ORDER BY id DESC LIMIT 1"
-                )
-                return row["cursor"] if row else "0"
+                return await conn.fetchval(_SELECT_LATEST_CURSOR) or "0"
         else:
-            async with self.conn.execute(
-                "SELECT cursor FROM sync_events ORDER BY id DESC LIMIT 1"
-            ) as cursor:
+            async with self.read_conn.execute(_SELECT_LATEST_CURSOR) as cursor:
                 row = await cursor.fetchone()
                 return row[0] if row else "0"
     
+    async def get_bootstrap(self, limit: int = 100) -> Tuple[str, List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Get the latest cursor, the first deltas and all tables for a client bootstrapping from cursor 0"""
+        # One statement: a single round trip, and the cursor matches the tables
+        if self.is_postgres:
+            async with self.pool.acquire() as conn:
+                latest, deltas, tables = await conn.fetchrow(_SELECT_BOOTSTRAP_PG, limit)
+        else:
+            async with self.read_conn.execute(_SELECT_BOOTSTRAP_SQLITE, (limit,)) as cursor:
+                latest, deltas, tables = await cursor.fetchone()
+            deltas = orjson.loads(deltas)
+            tables = orjson.loads(tables)
+        
+        return latest or "0", [dict(zip(_DELTA_FIELDS, delta)) for delta in deltas], tables
+    
     async def reset(self):
         """Reset database (development only)"""
+        self._table_cache.clear()
+        
         if self.is_postgres:
             async with self.pool.acquire() as conn:
                 await conn.execute("TRUNCATE tables, sync_events RESTART IDENTITY")
         else:
-            await self.conn.execute("DELETE FROM tables")
-            await self.conn.execute("DELETE FROM sync_events")
-            await self.conn.execute("DELETE FROM sqlite_sequence WHERE name='sync_events'")
-            await self.conn.commit()
+            async def write(conn):
+                await conn.execute("DELETE FROM tables")
+                await conn.execute("DELETE FROM sync_events")
+                await conn.execute("DELETE FROM sqlite_sequence WHERE name='sync_events'")
+            
+            await self._write(write)
     
     # Helper methods
+    async def _resolve_cursor_seq(self, cursor: str) -> int:
+        """Get the sequence number a cursor points at"""
+        seq = cursor_seq(cursor)
+        if seq is not None:
+            return seq
+        
+        # Cursors issued before sequence numbers were embedded in them; an
+        # unknown cursor resolves to the newest event so nothing is replayed
+        if self.is_postgres:
+            async with self.pool.acquire() as conn:
+                return await conn.fetchval(_LEGACY_CURSOR_SEQ_PG, cursor)
+        else:
+            async with self.read_conn.execute(_LEGACY_CURSOR_SEQ_SQLITE, (cursor,)) as cursor_result:
+                row = await cursor_result.fetchone()
+                return row[0]
+    
+    def _table_payload(self, table_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the JSON payload for a table, skipping its columns and in-memory keys"""
+        data = table_data.copy()
+        for key in _NON_PAYLOAD_KEYS:
+            data.pop(key, None)
+        return data
+    
     def _parse_table_row(self, row) -> Dict[str, Any]:
-        """Parse PostgreSQL table row"""
-        data = json.loads(row["data"]) if isinstance(row["data"], str) else row["data"]
+        """Parse PostgreSQL table row; the jsonb codec has already decoded data"""
         return {
-            "id": row["id"],
-            "name": row["name"],
-            **data,
-            "updatedAt": row["updated_at"].isoformat() if row["updated_at"] else None,
-            "version": row["version"]
+            "id": row[0],
+            "name": row[1],
+            **row[2],
+            "updatedAt": row[3],
+            "version": row[4]
         }
     
     def _parse_table_row_sqlite(self, row) -> Dict[str, Any]:
         """Parse SQLite table row"""
-        data = json.loads(row[2])  # data column
         return {
             "id": row[0],
             "name": row[1],
-            **data,
+            **orjson.loads(row[2]),
             "updatedAt": row[3],
             "version": row[4]
         }
     
     def _parse_event_row(self, row) -> Dict[str, Any]:
-        """Parse PostgreSQL event row"""
-        operation = json.loads(row["operation"]) if isinstance(row["operation"], str) else row["operation"]
+        """Parse PostgreSQL event row; the jsonb codec has already decoded operation"""
         return {
-            "id": row["id"],
-            "cursor": row["cursor"],
-            "clientId": row["client_id"],
-            "operation": operation,
-            "serverTs": row["server_ts"].isoformat() if row["server_ts"] else None,
-            "applied": row["applied"]
+            "id": row[0],
+            "cursor": row[1],
+            "clientId": row[2],
+            "operation": row[3],
+            "serverTs": row[4],
+            "applied": row[5]
         }
     
     def _parse_event_row_sqlite(self, row) -> Dict[str, Any]:
@@ -328,7 +821,7 @@ class Database:
             "id": row[0],
             "cursor": row[1],
             "clientId": row[2],
-            "operation": json.loads(row[3]),
+            "operation": orjson.loads(row[3]),
             "serverTs": row[4],
             "applied": bool(row[5])
         }
@@ -1,6 +1,6 @@
-# backend/models.py - Pydantic models for API
+# backend/models.py - msgspec models for API
 
-from pydantic import BaseModel, Field
+import msgspec
 from typing import List, Optional, Dict, Any, Union
 from datetime import datetime
 from enum import Enum
@@ -15,17 +15,17 @@ class OperationType(str, Enum):
     RENAME_TABLE = "renameTable"
     DELETE_TABLE = "deleteTable"
 
-class CellMeta(BaseModel):
+class CellMeta(msgspec.Struct):
     value: str
     ts: int  # timestamp in milliseconds
     by: str  # client ID
 
-class Row(BaseModel):
+class Row(msgspec.Struct):
     rowId: str
     cells: List[str]
     cellMeta: Optional[List[Optional[CellMeta]]] = []
 
-class Table(BaseModel):
+class Table(msgspec.Struct):
     id: str
     name: str
     headers: List[str]
@@ -33,7 +33,7 @@ class Table(BaseModel):
     updatedAt: str
     version: int = 1
 
-class ChangeOp(BaseModel):
+class ChangeOp(msgspec.Struct, kw_only=True, omit_defaults=True):
     op: OperationType
     tableId: str
     rowId: Optional[str] = None
@@ -45,12 +45,14 @@ class ChangeOp(BaseModel):
     name: Optional[str] = None
     ts: int  # Client timestamp
 
-class SyncRequest(BaseModel):
+class SyncRequest(msgspec.Struct):
+    # Decoded with msgspec on the sync hot path; ops are validated here so a
+    # malformed op is rejected before it can be stored and replayed to others
     clientId: str
     baseCursor: str
     ops: List[ChangeOp]
 
-class Delta(BaseModel):
+class Delta(msgspec.Struct, kw_only=True, omit_defaults=True):
     op: OperationType
     tableId: str
     rowId: Optional[str] = None
@@ -63,7 +65,7 @@ class Delta(BaseModel):
     serverTs: str  # Server timestamp
     by: Optional[str] = None  # Client ID that made the change
 
-class Conflict(BaseModel):
+class Conflict(msgspec.Struct, omit_defaults=True):
     tableId: str
     rowId: Optional[str]
     col: Optional[int]
@@ -71,14 +73,16 @@ class Conflict(BaseModel):
     remoteValue: str
     resolution: str  # "local" or "remote"
 
-class SyncResponse(BaseModel):
+class SyncResponse(msgspec.Struct, omit_defaults=True):
+    # deltas and conflicts hold the plain dicts SyncEngine builds, so encoding
+    # the response never re-validates them
     success: bool
     cursor: str
-    deltas: List[Delta]
-    conflicts: Optional[List[Conflict]] = []
+    deltas: List[Dict[str, Any]]
+    conflicts: List[Dict[str, Any]] = []
     error: Optional[str] = None
 
-class SyncEvent(BaseModel):
+class SyncEvent(msgspec.Struct, kw_only=True):
     id: Optional[int] = None
     cursor: str
     clientId: str
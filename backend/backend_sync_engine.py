@@ -1,80 +1,213 @@
 # backend/sync_engine.py - Sync engine for conflict resolution
 
-import json
-import hashlib
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import asyncio
+import itertools
+import time
+import weakref
+from collections import OrderedDict, defaultdict
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, NamedTuple, Tuple
 import logging
 
-from backend_database import Database
+import orjson
+
+from backend_database import Database, cursor_seq
 from backend_models import OperationType, Delta
 
 logger = logging.getLogger(__name__)
 
+_row_id = itemgetter("rowId")
+_DELETE_TABLE = OperationType.DELETE_TABLE.value
+
+# Upper bound on how long a bootstrap snapshot is reused, for writes that
+# do not go through this engine (other workers, direct table endpoints)
+SNAPSHOT_TTL_SECONDS = 5.0
+
+# How many times a sync reloads and re-applies a table that another writer
+# changed between load and save before its operations are rejected
+SAVE_ATTEMPTS = 3
+
+class ParsedOp(NamedTuple):
+    """Operation fields read once from the raw op dict"""
+    op: Optional[str]
+    table_id: Optional[str]
+    row_id: Optional[str]
+    col: Optional[int]
+    value: Optional[str]
+    ts: Optional[int]
+    after_row_id: Optional[str]
+    col_index: Optional[int]
+    header: Optional[str]
+    name: Optional[str]
+
+    @classmethod
+    def from_dict(cls, op: Dict[str, Any]) -> "ParsedOp":
+        get = op.get
+        return cls(
+            get("op"), get("tableId"), get("rowId"), get("col"), get("value"),
+            get("ts"), get("afterRowId"), get("colIndex"), get("header"), get("name")
+        )
+
 class SyncEngine:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, single_writer: bool = False, table_cache_size: int = 128):
         self.db = db
+        # In-memory state below is only trustworthy when this process is the
+        # sole writer; otherwise every read goes to the database
+        self.single_writer = single_writer
+        # Write-through LRU of loaded tables (with their row indexes)
+        self._table_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._table_cache_size = table_cache_size if single_writer else 0
+        # Newest cursor written, loaded by start()
+        self._latest_cursor = "0"
+        # Operation dispatch table keyed by the raw op strings clients send,
+        # so lookups compare plain strings rather than enum members
+        self._handlers = {
+            OperationType.SET_CELL.value: self._apply_set_cell,
+            OperationType.ADD_ROW.value: self._apply_add_row,
+            OperationType.DELETE_ROW.value: self._apply_delete_row,
+            OperationType.ADD_COLUMN.value: self._apply_add_column,
+            OperationType.DELETE_COLUMN.value: self._apply_delete_column,
+            OperationType.SET_HEADER.value: self._apply_set_header,
+            OperationType.RENAME_TABLE.value: self._apply_rename_table,
+            OperationType.DELETE_TABLE.value: self._apply_delete_table,
+        }
+        # Serialized cursor="0" response as (latest_cursor, created_at, body)
+        self._snapshot_cache: Optional[Tuple[str, float, bytes]] = None
+        self._snapshot_lock = asyncio.Lock()
+        # Per-table locks held by process_sync; entries go away with their last user
+        self._table_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+    
+    async def start(self):
+        """Load engine state from the database; call after Database.init()"""
+        self._latest_cursor = await self.db.get_latest_cursor()
+    
+    async def get_latest_cursor(self) -> str:
+        """Get the newest sync cursor"""
+        if self.single_writer:
+            return self._latest_cursor
+        return await self.db.get_latest_cursor()
     
     async def process_sync(self, client_id: str, base_cursor: str, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Process sync operations from client"""
         conflicts = []
-        applied_ops = []
+        latest_cursor = None
         
+        # Group operations by table so each table is loaded and written once
+        ops_by_table = defaultdict(list)
         for op in operations:
-            # Apply operation to database
+            parsed = ParsedOp.from_dict(op)
+            ops_by_table[parsed.table_id].append((op, parsed))
+        
+        for table_id, table_ops in ops_by_table.items():
+            # Syncs touching the same table take turns, so none of them loads
+            # or writes back a copy another one is still changing
+            async with self._table_lock(table_id):
+                cursor = await self._sync_table(table_id, table_ops, client_id, conflicts)
+            if cursor is not None:
+                latest_cursor = cursor
+        
+        if latest_cursor is None:
+            latest_cursor = await self.get_latest_cursor()
+        
+        # Get any changes from other clients since base_cursor
+        other_changes = await self._get_other_client_changes(base_cursor, client_id)
+        
+        return {
+            "cursor": latest_cursor,
+            "deltas": other_changes,
+            "conflicts": conflicts
+        }
+    
+    async def _sync_table(self, table_id: Optional[str], table_ops: List[Tuple[Dict[str, Any], ParsedOp]],
+                          client_id: str, conflicts: List[Dict[str, Any]]) -> Optional[str]:
+        """Apply one table's operations and store the result; returns the new cursor if anything was applied"""
+        for _ in range(SAVE_ATTEMPTS):
+            table = await self._load_table(table_id) if table_id else None
+            version = table["version"] if table else None
+            table, applied_ops, failed = self._apply_table_ops(table, table_id, table_ops, client_id)
+            if not applied_ops:
+                conflicts.extend(failed)
+                return None
+            
+            # The table and the events that changed it are stored in one
+            # transaction, so other clients always get deltas for stored state
             try:
-                success = await self._apply_operation(op, client_id)
+                latest_cursor = await self.db.save_table_changes(
+                    table_id, version, table, client_id, applied_ops
+                )
+            except Exception:
+                # The cached copy now holds changes that were never stored
+                self._table_cache.pop(table_id, None)
+                raise
+            
+            if latest_cursor is not None:
+                break
+            # Another writer stored the table after it was loaded; start over
+            # from its current state rather than overwrite that change
+            self._table_cache.pop(table_id, None)
+        else:
+            logger.warning(f"Table {table_id} kept changing during sync; rejecting {len(table_ops)} operations")
+            conflicts.extend(
+                {"operation": op, "reason": "Table changed concurrently"} for op, _ in table_ops
+            )
+            return None
+        
+        conflicts.extend(failed)
+        if table is not None:
+            # Keep the cached copy in step with the stored row
+            table["version"] = version + 1
+        
+        self.invalidate_snapshot()
+        # Syncs can finish out of order; keep the highest sequence
+        if cursor_seq(latest_cursor) > (cursor_seq(self._latest_cursor) or 0):
+            self._latest_cursor = latest_cursor
+        
+        return latest_cursor
+    
+    def _apply_table_ops(self, table: Optional[Dict[str, Any]], table_id: Optional[str],
+                         table_ops: List[Tuple[Dict[str, Any], ParsedOp]], client_id: str
+                         ) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Apply operations to a loaded table; returns the table (None once deleted), applied ops and conflicts"""
+        applied_ops = []
+        failed = []
+        
+        # Handlers only mutate the in-memory table; the database is
+        # touched once per table after the whole group is applied
+        for op, parsed in table_ops:
+            try:
+                success = self._apply_operation(table, parsed, client_id)
             except Exception as e:
                 logger.error(f"Error applying operation: {e}")
                 success = False
             
             if success:
-                applied_ops.append(op)
-                
-                # Generate cursor for this operation
-                cursor = self._generate_cursor(client_id, op)
+                if parsed.op == _DELETE_TABLE:
+                    # Later ops in the group see no table, and earlier
+                    # edits are never written back
+                    self._table_cache.pop(table_id, None)
+                    table = None
                 
-                # Store in sync events
-                await self.db.add_sync_event(cursor, client_id, op)
+                applied_ops.append(op)
             else:
                 # Track conflict
-                conflicts.append({
+                failed.append({
                     "operation": op,
                     "reason": "Failed to apply"
                 })
         
-        # Get latest cursor
-        latest_cursor = await self.db.get_latest_cursor()
-        
-        # Get any changes from other clients since base_cursor
-        other_changes = await self._get_other_client_changes(base_cursor, client_id)
-        
-        return {
-            "cursor": latest_cursor,
-            "deltas": other_changes,
-            "conflicts": conflicts
-        }
+        return table, applied_ops, failed
     
     async def get_changes_since(self, cursor: str) -> Dict[str, Any]:
         """Get all changes since a cursor"""
         try:
-            # Get events since cursor
-            events = await self.db.get_events_since(cursor)
-            
-            # Convert to deltas
-            deltas = []
-            for event in events:
-                delta = self._event_to_delta(event)
-                if delta:
-                    deltas.append(delta)
-            
-            # Get latest cursor
-            latest_cursor = await self.db.get_latest_cursor()
-            
-            # If requesting from beginning, also send current table state
-            tables = []
             if cursor == "0":
-                tables = await self.db.get_all_tables()
+                # Requesting from the beginning also sends the current table
+                # state; everything comes from one consistent read
+                latest_cursor, deltas, tables = await self.db.get_bootstrap()
+            else:
+                deltas = await self.db.get_deltas_since(cursor)
+                latest_cursor = await self.get_latest_cursor()
+                tables = []
             
             return {
                 "cursor": latest_cursor,
@@ -86,69 +219,262 @@ class SyncEngine:
             logger.error(f"Get changes failed: {e}")
             raise
     
-    async def _apply_operation(self, op: Dict[str, Any], client_id: str) -> bool:
-        """Apply a single operation to the database"""
-        op_type = op.get("op")
-        table_id = op.get("tableId")
+    async def get_snapshot(self) -> bytes:
+        """Get the serialized full-state response for clients bootstrapping from cursor 0"""
+        latest_cursor = await self.get_latest_cursor()
+        if self._snapshot_is_fresh(latest_cursor):
+            return self._snapshot_cache[2]
         
-        if not op_type or not table_id:
-            return False
+        # Let one request rebuild the snapshot while concurrent ones wait for it
+        async with self._snapshot_lock:
+            if self._snapshot_is_fresh(latest_cursor):
+                return self._snapshot_cache[2]
+            
+            result = await self.get_changes_since("0")
+            body = orjson.dumps(result)
+            self._snapshot_cache = (result["cursor"], time.monotonic(), body)
+            return body
+    
+    def invalidate_snapshot(self):
+        """Drop the cached bootstrap snapshot after table state changes"""
+        self._snapshot_cache = None
+    
+    def invalidate_table(self, table_id: Optional[str] = None):
+        """Forget cached state for a table changed outside the engine, or for all tables"""
+        if table_id is None:
+            self._table_cache.clear()
+        else:
+            self._table_cache.pop(table_id, None)
+        self.invalidate_snapshot()
+    
+    def _table_lock(self, table_id: Optional[str]) -> asyncio.Lock:
+        """Get the lock serializing syncs of one table"""
+        lock = self._table_locks.get(table_id)
+        if lock is None:
+            lock = self._table_locks[table_id] = asyncio.Lock()
+        return lock
+    
+    async def _load_table(self, table_id: str) -> Optional[Dict[str, Any]]:
+        """Get a table from the write-through cache, loading it on a miss"""
+        table = self._table_cache.get(table_id)
+        if table is not None:
+            self._table_cache.move_to_end(table_id)
+            return table
         
-        # Get current table
         table = await self.db.get_table(table_id)
+        # Another sync may have cached (and changed) its copy meanwhile
+        cached = self._table_cache.get(table_id)
+        if cached is not None:
+            return cached
+        if table is not None and self._table_cache_size > 0:
+            self._table_cache[table_id] = table
+            if len(self._table_cache) > self._table_cache_size:
+                self._table_cache.popitem(last=False)
+        return table
+    
+    def _snapshot_is_fresh(self, latest_cursor: str) -> bool:
+        cache = self._snapshot_cache
+        return (
+            cache is not None
+            and cache[0] == latest_cursor
+            and time.monotonic() - cache[1] < SNAPSHOT_TTL_SECONDS
+        )
+    
+    def _apply_operation(self, table: Optional[Dict[str, Any]], op: ParsedOp, client_id: str) -> bool:
+        """Apply a single operation to an already loaded table"""
+        op_type = op.op
+        table_id = op.table_id
         
-        try:
-            if op_type == OperationType.SET_CELL:
-                return await self._apply_set_cell(table, op, client_id)
-            elif op_type == OperationType.ADD_ROW:
-                return await self._apply_add_row(table, op, client_id)
-            elif op_type == OperationType.DELETE_ROW:
-                return await self._apply_delete_row(table, op, client_id)
-            elif op_type == OperationType.ADD_COLUMN:
-                return await self._apply_add_column(table, op, client_id)
-            elif op_type == OperationType.DELETE_COLUMN:
-                return await self._apply_delete_column(table, op, client_id)
-            elif op_type == OperationType.SET_HEADER:
-                return await self._apply_set_header(table, op, client_id)
-            elif op_type == OperationType.RENAME_TABLE:
-                return await self._apply_rename_table(table, op, client_id)
-            else:
-                logger.warning(f"Unknown operation type: {op_type}")
-                return False
-        except Exception as e:
-            logger.error(f"Error applying operation {op_type}: {e}")
+        if not op_type or not table_id:
             return False
+        
+        handler = self._handlers.get(op_type)
+        if not handler:
+            logger.warning(f"Unknown operation type: {op_type}")
+            return False
+        
+        # Handler errors are logged and counted as conflicts by process_sync
+        return handler(table, op, client_id)
 
-    # Placeholder methods for the actual operation implementations
-    async def _apply_set_cell(self, table, op, client_id):
-        pass
+    # Operation handlers
+    def _row_index(self, table: Dict[str, Any]) -> Dict[str, int]:
+        """Get the rowId -> position index for a table, building it on first use"""
+        index = table.get("_rowIndex")
+        if index is None:
+            index = {row["rowId"]: i for i, row in enumerate(table.get("rows", []))}
+            table["_rowIndex"] = index
+        return index
 
-    async def _apply_add_row(self, table, op, client_id):
-        pass
+    def _reindex_rows_from(self, index: Dict[str, int], rows: List[Dict[str, Any]], start: int):
+        """Refresh index positions for rows[start:] without a Python-level loop"""
+        index.update(zip(map(_row_id, itertools.islice(rows, start, None)), itertools.count(start)))
 
-    async def _apply_delete_row(self, table, op, client_id):
-        pass
+    def _apply_set_cell(self, table, op, client_id):
+        """Set a single cell value using per-cell Last-Writer-Wins"""
+        if not table:
+            return False
+        
+        idx = self._row_index(table).get(op.row_id)
+        col = op.col
+        if idx is None or col is None or not 0 <= col < len(table.get("headers", [])):
+            return False
+        
+        row = table["rows"][idx]
+        cells = row.setdefault("cells", [])
+        cell_meta = row.get("cellMeta") or []
+        current_meta = cell_meta[col] if col < len(cell_meta) else None
+        ts = op.ts
+        
+        if not self._should_apply_change(current_meta, ts, client_id):
+            # Another writer already holds a newer value for this cell
+            return False
+        
+        # New rows are created at full width; only rows stored narrower than
+        # the headers need padding, in a single extend
+        if len(cells) <= col:
+            cells.extend([""] * (col + 1 - len(cells)))
+        if len(cell_meta) <= col:
+            cell_meta.extend([None] * (col + 1 - len(cell_meta)))
+        
+        value = op.value or ""
+        cells[col] = value
+        cell_meta[col] = {"value": value, "ts": ts, "by": client_id}
+        row["cellMeta"] = cell_meta
+        
+        return True
 
-    async def _apply_add_column(self, table, op, client_id):
-        pass
+    def _apply_add_row(self, table, op, client_id):
+        """Insert a new row, optionally after an existing row"""
+        if not table:
+            return False
+        
+        row_id = op.row_id
+        if not row_id:
+            return False
+        
+        index = self._row_index(table)
+        if row_id in index:
+            # Row already exists, adding it again is a no-op
+            return True
+        
+        rows = table.setdefault("rows", [])
+        ncols = len(table.get("headers", []))
+        new_row = {
+            "rowId": row_id,
+            "cells": [""] * ncols,
+            "cellMeta": [None] * ncols
+        }
+        
+        after = index.get(op.after_row_id)
+        if after is None:
+            rows.append(new_row)
+            index[row_id] = len(rows) - 1
+        else:
+            rows.insert(after + 1, new_row)
+            # Shift positions of every row after the insertion point
+            self._reindex_rows_from(index, rows, after + 1)
+        
+        return True
 
-    async def _apply_delete_column(self, table, op, client_id):
-        pass
+    def _apply_delete_row(self, table, op, client_id):
+        """Delete a row, preserving the order of the remaining rows"""
+        if not table:
+            return False
+        
+        index = self._row_index(table)
+        idx = index.pop(op.row_id, None)
+        if idx is None:
+            # Row already gone
+            return True
+        
+        # Delete in place; rows keep their order, so only the tail is re-indexed
+        rows = table["rows"]
+        del rows[idx]
+        self._reindex_rows_from(index, rows, idx)
+        
+        return True
+
+    def _apply_add_column(self, table, op, client_id):
+        """Insert a column into the headers and every row"""
+        if not table:
+            return False
+        
+        headers = table.setdefault("headers", [])
+        col_index = op.col_index
+        if col_index is None or not 0 <= col_index <= len(headers):
+            col_index = len(headers)
+        
+        headers.insert(col_index, op.header or f"Col {col_index + 1}")
+        
+        # Shift cells and metadata in a single pass over the rows; the lists
+        # are mutated in place, so rows only need a store when a key is missing
+        for row in table.get("rows", []):
+            row.setdefault("cells", []).insert(col_index, "")
+            
+            cell_meta = row.get("cellMeta")
+            if cell_meta and col_index < len(cell_meta):
+                cell_meta.insert(col_index, None)
+        
+        return True
+
+    def _apply_delete_column(self, table, op, client_id):
+        """Remove a column from the headers and every row"""
+        if not table:
+            return False
+        
+        headers = table.get("headers", [])
+        col_index = op.col_index
+        if col_index is None or not 0 <= col_index < len(headers):
+            return False
+        
+        del headers[col_index]
+        
+        for row in table.get("rows", []):
+            cells = row.get("cells")
+            if cells and col_index < len(cells):
+                del cells[col_index]
+            
+            cell_meta = row.get("cellMeta")
+            if cell_meta and col_index < len(cell_meta):
+                del cell_meta[col_index]
+        
+        return True
 
-    async def _apply_set_header(self, table, op, client_id):
-        pass
+    def _apply_set_header(self, table, op, client_id):
+        """Rename a single column header"""
+        if not table:
+            return False
+        
+        headers = table.get("headers", [])
+        col_index = op.col_index
+        if col_index is None or not 0 <= col_index < len(headers):
+            return False
+        
+        headers[col_index] = op.header or ""
+        return True
 
-    async def _apply_rename_table(self, table, op, client_id):
-        pass
+    def _apply_rename_table(self, table, op, client_id):
+        """Rename a table"""
+        if not table or not op.name:
+            return False
+        
+        table["name"] = op.name
+        return True
 
-    def _generate_cursor(self, client_id, op):
-        # Dummy implementation
-        return hashlib.sha256(f"{client_id}{json.dumps(op)}".encode()).hexdigest()
+    def _apply_delete_table(self, table, op, client_id):
+        """Accept a table deletion; process_sync removes the row once the batch is applied"""
+        return bool(table)
 
-    async def _get_other_client_changes(self, base_cursor, client_id):
-        # Dummy implementation
-        return []
+    def _should_apply_change(self, current_meta, remote_ts, remote_client_id) -> bool:
+        """Last-Writer-Wins with client ID as tiebreaker"""
+        if not current_meta or not current_meta.get("ts"):
+            # No existing metadata, apply remote
+            return True
+        
+        # Timestamps compare first, then client IDs lexicographically
+        return (remote_ts or 0, remote_client_id) > (current_meta["ts"], current_meta.get("by") or "")
 
-    def _event_to_delta(self, event):
-        # Dummy implementation
-        return None
+    async def _get_other_client_changes(self, base_cursor: str, client_id: str) -> List[Dict[str, Any]]:
+        """Get deltas made by other clients since base_cursor"""
+        # Same-client events are filtered out and projected into deltas by the database
+        return await self.db.get_deltas_since(base_cursor, exclude_client_id=client_id)
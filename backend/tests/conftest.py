@@ -0,0 +1,46 @@
+# backend/tests/conftest.py - Shared pytest fixtures
+
+import os
+import sys
+
+import pytest_asyncio
+
+# The backend modules live one level up and are imported by their file names
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend_database import Database
+from backend_sync_engine import SyncEngine
+
+def make_table(table_id: str, headers=("a", "b"), row_ids=()):
+    """Build a table dict in the shape the API stores"""
+    return {
+        "id": table_id,
+        "name": table_id.upper(),
+        "headers": list(headers),
+        "rows": [
+            {"rowId": row_id, "cells": [""] * len(headers), "cellMeta": [None] * len(headers)}
+            for row_id in row_ids
+        ],
+        "updatedAt": "",
+        "version": 1
+    }
+
+@pytest_asyncio.fixture
+async def db_path(tmp_path):
+    """URL of a fresh SQLite database file"""
+    return f"sqlite:///{tmp_path / 'tablehub.db'}"
+
+@pytest_asyncio.fixture
+async def db(db_path):
+    """Initialized database on a temporary SQLite file"""
+    database = Database(db_path)
+    await database.init()
+    yield database
+    await database.close()
+
+@pytest_asyncio.fixture
+async def engine(db):
+    """Sync engine in the single-writer configuration"""
+    sync_engine = SyncEngine(db, single_writer=True)
+    await sync_engine.start()
+    return sync_engine
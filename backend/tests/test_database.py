@@ -0,0 +1,142 @@
+# backend/tests/test_database.py - Database tests against a temporary SQLite file
+
+import asyncio
+
+import pytest
+
+from backend_database import Database, cursor_seq
+from conftest import make_table
+
+pytestmark = pytest.mark.asyncio
+
+async def _table_ids(db):
+    return sorted(table["id"] for table in await db.get_all_tables())
+
+async def test_failing_job_in_batch_only_undoes_itself(db):
+    async def insert(table_id, fail=False):
+        async def job(conn):
+            await conn.execute("INSERT INTO tables (id, name, data) VALUES (?, ?, '{}')", (table_id, table_id))
+            if fail:
+                raise ValueError("boom")
+            return table_id
+        return await db._write(job)
+
+    results = await asyncio.gather(
+        insert("t1"), insert("t2", fail=True), insert("t3"), return_exceptions=True
+    )
+
+    assert results[0] == "t1" and results[2] == "t3"
+    assert isinstance(results[1], ValueError)
+    assert await _table_ids(db) == ["t1", "t3"]
+
+async def test_writer_survives_failed_rollback_and_batch(db):
+    real_rollback = db.conn.rollback
+
+    async def broken_rollback():
+        await real_rollback()
+        raise RuntimeError("rollback failed")
+
+    async def boom(conn):
+        raise ValueError("boom")
+
+    db.conn.rollback = broken_rollback
+    with pytest.raises(ValueError):
+        await asyncio.wait_for(db._write(boom), 5)
+    db.conn.rollback = real_rollback
+
+    async def broken_batch(jobs):
+        raise RuntimeError("writer bug")
+
+    real_batch = db._run_write_batch
+    db._run_write_batch = broken_batch
+    results = await asyncio.wait_for(
+        asyncio.gather(*(db.add_sync_event("c", {"op": "x"}) for _ in range(3)), return_exceptions=True), 5
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+    db._run_write_batch = real_batch
+
+    # The writer task is still running and takes new writes
+    assert await asyncio.wait_for(db.add_sync_event("c", {"op": "x"}), 5) == "1_c"
+
+async def test_event_seqs_are_unique_and_ordered_under_concurrent_pushes(db):
+    cursors = await asyncio.gather(*(db.add_sync_events(f"c{i}", [{"op": "x"}, {"op": "y"}]) for i in range(20)))
+
+    events = await db.get_events_since("0", limit=100)
+    seqs = [cursor_seq(event["cursor"]) for event in events]
+    assert seqs == list(range(1, 41))
+    assert sorted(cursor_seq(cursor) for cursor in cursors) == list(range(2, 41, 2))
+
+async def test_event_seqs_are_unique_across_database_instances(db, db_path):
+    other = Database(db_path)
+    await other.init()
+    try:
+        await asyncio.gather(*(
+            (db if i % 2 else other).add_sync_event(f"c{i}", {"op": "x"}) for i in range(20)
+        ))
+    finally:
+        await other.close()
+
+    events = await db.get_events_since("0", limit=100)
+    assert [cursor_seq(event["cursor"]) for event in events] == list(range(1, 21))
+
+async def test_save_table_changes_is_atomic(db):
+    await db.create_table(make_table("t1", row_ids=["r1"]))
+    table = await db.get_table("t1")
+    table["name"] = "changed"
+
+    async def broken_insert(conn, client_id, operations):
+        raise RuntimeError("insert failed")
+
+    db._insert_events_sqlite = broken_insert
+    with pytest.raises(RuntimeError):
+        await db.save_table_changes("t1", table["version"], table, "c", [{"op": "renameTable"}])
+    del db._insert_events_sqlite
+
+    stored = await db.get_table("t1")
+    assert stored["name"] == "T1" and stored["version"] == 1
+    assert await db.get_events_since("0") == []
+
+async def test_save_table_changes_refuses_a_changed_version(db):
+    await db.create_table(make_table("t1"))
+    table = await db.get_table("t1")
+    await db.update_table("t1", dict(table, name="rest"))
+
+    table["name"] = "sync"
+    assert await db.save_table_changes("t1", table["version"], table, "c", [{"op": "renameTable"}]) is None
+    assert await db.save_table_changes("t1", table["version"], None, "c", [{"op": "deleteTable"}]) is None
+
+    stored = await db.get_table("t1")
+    assert stored["name"] == "rest" and stored["version"] == 2
+    assert await db.get_events_since("0") == []
+
+async def test_reads_see_new_commits_while_tables_stream(db):
+    for table_id in ("t1", "t2"):
+        await db.create_table(make_table(table_id))
+    stream = db.iter_tables(chunk=1)
+    await stream.__anext__()
+
+    await db.update_table("t1", make_table("t1", headers=["x"]))
+    await db.add_sync_event("c", {"op": "x"})
+
+    assert (await db.get_table("t1"))["headers"] == ["x"]
+    assert await db.get_latest_cursor() == "1_c"
+    assert len([table async for table in stream]) == 1
+
+async def test_get_table_survives_eviction_during_version_probe(db):
+    table = make_table("t1")
+    await db.create_table(table)
+    await db.get_table("t1")
+
+    results = await asyncio.gather(db.get_table("t1"), db.update_table("t1", dict(table, name="new")))
+    assert results[0]["id"] == "t1" and results[1] is True
+    assert (await db.get_table("t1"))["name"] == "new"
+
+async def test_cursor_seq_rejects_values_outside_64_bits():
+    assert cursor_seq("12_client") == 12
+    assert cursor_seq(f"{2**63 - 1}_c") == 2**63 - 1
+    assert cursor_seq("99999999999999999999999_x") is None
+    assert cursor_seq("legacy") is None
+
+async def test_out_of_range_cursor_resolves_like_an_unknown_one(db):
+    await db.add_sync_event("c", {"op": "x"})
+    assert await db.get_deltas_since("99999999999999999999999_x") == []
@@ -0,0 +1,125 @@
+# backend/tests/test_sync_engine.py - SyncEngine tests against a temporary SQLite file
+
+import asyncio
+
+import pytest
+
+from backend_database import Database, cursor_seq
+from backend_sync_engine import ParsedOp, SyncEngine
+from conftest import make_table
+
+pytestmark = pytest.mark.asyncio
+
+def _apply(engine, table, op, client_id="c"):
+    return engine._apply_operation(table, ParsedOp.from_dict(op), client_id)
+
+def _row_ids(table):
+    return [row["rowId"] for row in table["rows"]]
+
+def _assert_index_matches(engine, table):
+    assert engine._row_index(table) == {row_id: i for i, row_id in enumerate(_row_ids(table))}
+
+async def test_row_index_follows_inserts_and_deletes(engine):
+    table = make_table("t1", row_ids=["r1", "r2"])
+
+    for op in (
+        {"op": "addRow", "tableId": "t1", "rowId": "r3"},
+        {"op": "addRow", "tableId": "t1", "rowId": "r4", "afterRowId": "r1"},
+        {"op": "addRow", "tableId": "t1", "rowId": "r5", "afterRowId": "missing"},
+        {"op": "deleteRow", "tableId": "t1", "rowId": "r1"},
+        {"op": "addRow", "tableId": "t1", "rowId": "r6", "afterRowId": "r2"},
+        {"op": "deleteRow", "tableId": "t1", "rowId": "r5"},
+        {"op": "deleteRow", "tableId": "t1", "rowId": "r5"},
+    ):
+        assert _apply(engine, table, op)
+        _assert_index_matches(engine, table)
+
+    assert _row_ids(table) == ["r4", "r2", "r6", "r3"]
+
+async def test_set_cell_last_writer_wins_with_client_id_tiebreak(engine):
+    table = make_table("t1", row_ids=["r1"])
+
+    def set_cell(value, ts, client_id):
+        op = {"op": "setCell", "tableId": "t1", "rowId": "r1", "col": 0, "value": value, "ts": ts}
+        return _apply(engine, table, op, client_id)
+
+    assert set_cell("first", 10, "b")
+    assert not set_cell("older", 9, "z")
+    assert not set_cell("same ts, lower id", 10, "a")
+    assert not set_cell("same ts, same id", 10, "b")
+    assert set_cell("same ts, higher id", 10, "c")
+    assert set_cell("newer", 11, "a")
+
+    row = table["rows"][0]
+    assert row["cells"][0] == "newer"
+    assert row["cellMeta"][0] == {"value": "newer", "ts": 11, "by": "a"}
+
+async def test_set_cell_rejects_columns_outside_headers(engine):
+    table = make_table("t1", headers=["a"], row_ids=["r1"])
+
+    for col in (-1, 1, 2000000):
+        assert not _apply(engine, table, {"op": "setCell", "tableId": "t1", "rowId": "r1", "col": col, "ts": 1})
+    assert table["rows"][0]["cells"] == [""]
+
+async def test_concurrent_pushes_get_ordered_cursors_and_keep_every_row(db, engine):
+    await db.create_table(make_table("t1"))
+
+    results = await asyncio.gather(*(
+        engine.process_sync(f"c{i}", "0", [{"op": "addRow", "tableId": "t1", "rowId": f"r{i}", "ts": i}])
+        for i in range(20)
+    ))
+
+    assert sorted(cursor_seq(result["cursor"]) for result in results) == list(range(1, 21))
+    assert sorted(_row_ids(await db.get_table("t1"))) == sorted(f"r{i}" for i in range(20))
+    assert await engine.get_latest_cursor() == await db.get_latest_cursor()
+
+async def test_engines_sharing_a_database_do_not_overwrite_each_other(db, db_path):
+    other_db = Database(db_path)
+    await other_db.init()
+    try:
+        engines = [SyncEngine(db), SyncEngine(other_db)]
+        await db.create_table(make_table("t1"))
+
+        results = await asyncio.gather(*(
+            engines[i % 2].process_sync(f"c{i}", "0", [{"op": "addRow", "tableId": "t1", "rowId": f"r{i}", "ts": i}])
+            for i in range(10)
+        ))
+    finally:
+        await other_db.close()
+
+    assert all(result["conflicts"] == [] for result in results)
+    assert sorted(_row_ids(await db.get_table("t1"))) == sorted(f"r{i}" for i in range(10))
+    assert len(await db.get_events_since("0")) == 10
+
+async def test_sync_reapplies_on_top_of_a_concurrent_table_update(db, engine):
+    await db.create_table(make_table("t1", row_ids=["r1"]))
+    # Load the table into the engine's cache, then change it behind the engine's back
+    await engine.process_sync("c", "0", [{"op": "setCell", "tableId": "t1", "rowId": "r1", "col": 0, "value": "x", "ts": 1}])
+    await db.update_table("t1", dict(await db.get_table("t1"), name="renamed"))
+
+    result = await engine.process_sync(
+        "c", "0", [{"op": "setCell", "tableId": "t1", "rowId": "r1", "col": 1, "value": "y", "ts": 2}]
+    )
+
+    assert result["conflicts"] == []
+    table = await db.get_table("t1")
+    assert table["name"] == "renamed"
+    assert table["rows"][0]["cells"] == ["x", "y"]
+
+async def test_failed_save_stores_neither_table_nor_events(db, engine):
+    await db.create_table(make_table("t1", row_ids=["r1"]))
+
+    async def broken_insert(conn, client_id, operations):
+        raise RuntimeError("insert failed")
+
+    db._insert_events_sqlite = broken_insert
+    with pytest.raises(RuntimeError):
+        await engine.process_sync("c", "0", [{"op": "deleteRow", "tableId": "t1", "rowId": "r1", "ts": 1}])
+    del db._insert_events_sqlite
+
+    assert _row_ids(await db.get_table("t1")) == ["r1"]
+    assert await db.get_events_since("0") == []
+    # The engine dropped its unsaved copy and works from the stored state
+    result = await engine.process_sync("c", "0", [{"op": "addRow", "tableId": "t1", "rowId": "r2", "ts": 2}])
+    assert result["cursor"] == "1_c"
+    assert _row_ids(await db.get_table("t1")) == ["r1", "r2"]